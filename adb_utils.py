@@ -1,6 +1,9 @@
 import subprocess
 import os
 import datetime
+import shlex
+import time
+import uuid
 from output_generator import log_action
 
 COMMON_DB_PATHS = [
@@ -10,36 +13,59 @@ COMMON_DB_PATHS = [
     "/data/data/com.google.android.apps.maps/databases/gmm_storage.db",
 ]
 
-def _run_adb_command(command_parts):
-    """Executes an ADB command and logs it."""
+LOCATION_TABLE_KEYWORDS = ['location', 'position', 'coordinate', 'latitude']
+DEVICE_CACHE_TTL_SECONDS = 2  # How long a device listing is reused within one run
+
+_device_cache = None  # (time.monotonic() of the listing, device ids)
+
+def _run_adb_command(command_parts, text=True):
+    """Executes an ADB command and logs it.
+    
+    With text=False the raw stdout/stderr bytes are returned undecoded, for
+    callers that only scan the output for ASCII markers.
+    """
     cmd_str = ' '.join(['adb'] + command_parts)
     log_action(f"Executing: {cmd_str}")
     
     try:
         result = subprocess.run(
             ['adb'] + command_parts,
-            capture_output=True,
-            text=True,
-            encoding='utf-8'
+            capture_output=True
         )
+        stdout, stderr = result.stdout.strip(), result.stderr.strip()
         
-        if result.stdout:
-            log_action(f"Output: {result.stdout.strip()[:200]}{'...' if len(result.stdout.strip()) > 200 else ''}")
-        if result.stderr:
-            log_action(f"Error: {result.stderr.strip()}")
-            
-        return result.stdout.strip(), result.stderr.strip()
+        # Only the logged excerpt is decoded
+        if stdout:
+            excerpt = stdout[:200].decode('utf-8', errors='replace')
+            log_action(f"Output: {excerpt}{'...' if len(stdout) > 200 else ''}")
+        if stderr:
+            log_action(f"Error: {stderr.decode('utf-8', errors='replace')}", error=True)
+        
+        if text:
+            return stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace')
+        return stdout, stderr
     except FileNotFoundError:
         error_msg = "ADB not found. Please install Android SDK Platform Tools."
-        log_action(f"Error: {error_msg}")
-        return "", error_msg
+        log_action(f"Error: {error_msg}", error=True)
+        return ("", error_msg) if text else (b"", error_msg.encode('utf-8'))
     except Exception as e:
         error_msg = f"Unexpected error: {e}"
-        log_action(f"Error: {error_msg}")
-        return "", error_msg
+        log_action(f"Error: {error_msg}", error=True)
+        return ("", error_msg) if text else (b"", error_msg.encode('utf-8'))
 
-def get_connected_devices():
-    """Lists all connected ADB devices."""
+def get_connected_devices(force=False):
+    """Lists all connected ADB devices.
+    
+    A result younger than DEVICE_CACHE_TTL_SECONDS is reused instead of running
+    'adb devices' again; pass force=True to always query adb.
+    """
+    global _device_cache
+    if not force and _device_cache is not None:
+        cached_at, cached_devices = _device_cache
+        if time.monotonic() - cached_at < DEVICE_CACHE_TTL_SECONDS:
+            log_action(f"Using cached ADB device list: {cached_devices}")
+            return list(cached_devices)
+    
     log_action("Checking for connected ADB devices...")
     stdout, stderr = _run_adb_command(['devices'])
     
@@ -58,93 +84,235 @@ def get_connected_devices():
     if not devices:
         log_action("No ADB devices found")
     
+    _device_cache = (time.monotonic(), list(devices))
     return devices
 
-def discover_all_databases(device_id):
-    """Comprehensive database discovery on the device."""
-    log_action(f"Starting comprehensive database discovery on device {device_id}")
+class AdbShell:
+    """A persistent `adb shell` session that runs commands without spawning adb each time."""
     
-    # First check if we have root access
-    log_action("Checking device root access...")
-    stdout, stderr = _run_adb_command(['-s', device_id, 'shell', 'su', '-c', 'id'])
-    has_root = 'uid=0' in stdout
-    log_action(f"Root access: {'Available' if has_root else 'Not available'}")
+    def __init__(self, device_id):
+        self.device_id = device_id
+        # The marker is assembled by printf on the device, so it never appears verbatim in
+        # the command text a PTY would echo back
+        self._token = uuid.uuid4().hex
+        self._sentinel = f"__END_{self._token}__"
+        self._proc = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def start(self):
+        """Opens the shell session on the device."""
+        log_action(f"Opening persistent shell on device {self.device_id}")
+        
+        # Devices with shell_v2 can run the session without a PTY; older ones always get one
+        features, _ = _run_adb_command(['-s', self.device_id, 'features'])
+        use_pty = 'shell_v2' not in features.split()
+        command = ['adb', '-s', self.device_id, 'shell'] + ([] if use_pty else ['-T'])
+        try:
+            self._proc = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding='utf-8',
+                bufsize=1
+            )
+        except FileNotFoundError:
+            log_action("Error: ADB not found. Please install Android SDK Platform Tools.", error=True)
+            return
+        except Exception as e:
+            log_action(f"Error: Unexpected error: {e}", error=True)
+            return
+        
+        # On a PTY the shell is interactive: it echoes input and prints PS1/PS2 prompts.
+        # Switch both off so neither mixes into command output
+        if use_pty:
+            self.run("stty -echo </dev/tty; PS1=''; PS2=''")
+    
+    def run(self, command, as_root=False):
+        """Runs a command in the session and returns (output, exit_status)."""
+        if as_root:
+            command = f"su -c {shlex.quote(command)}"
+        log_action(f"Executing (shell): {command}")
+        
+        if self._proc is None or self._proc.poll() is not None:
+            log_action("Error: ADB shell session is not running", error=True)
+            return "", -1
+        
+        # Group the command so its stderr is ordered with stdout, then mark the end on a line of its own
+        try:
+            self._proc.stdin.write(
+                f"{{ {command}\n}} </dev/null 2>&1; printf '\\n__END_%s__%s\\n' {self._token} \"$?\"\n"
+            )
+            self._proc.stdin.flush()
+        except OSError as e:
+            log_action(f"Error: ADB shell session closed: {e}", error=True)
+            return "", -1
+        
+        lines = []
+        status = -1
+        for line in self._proc.stdout:
+            # Only a line that is exactly the marker plus an exit status ends the command
+            status_text = line.rstrip('\r\n')[len(self._sentinel):]
+            if line.startswith(self._sentinel) and status_text.isdigit():
+                status = int(status_text)
+                break
+            lines.append(line)
+        
+        output = ''.join(lines).strip()
+        if output:
+            log_action(f"Output: {output[:200]}{'...' if len(output) > 200 else ''}")
+        return output, status
+    
+    def close(self):
+        """Ends the shell session."""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write("exit\n")
+            self._proc.stdin.close()
+            self._proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+            self._proc.wait()
+        self._proc = None
+
+def _list_tables(shell, db_files, has_root):
+    """Lists the tables of several databases in a single batched shell invocation."""
+    quoted = ' '.join(shlex.quote(db) for db in db_files)
+    script = f'for f in {quoted}; do echo "==$f=="; sqlite3 "$f" .tables 2>/dev/null; done'
+    stdout, _ = shell.run(script, as_root=has_root)
+    
+    tables = {db: [] for db in db_files}
+    current = None
+    for line in stdout.splitlines():
+        if line.startswith('==') and line.endswith('==') and line[2:-2] in tables:
+            current = line[2:-2]
+        elif current:
+            tables[current].append(line.strip())
     
-    # Try to list all databases
+    return {db: ' '.join(lines).strip() for db, lines in tables.items()}
+
+def _probe_databases(shell, has_root):
+    """Searches the device for .db files and flags those with location-like tables."""
     log_action("Searching for all .db files in /data/data/...")
     
     if has_root:
         # If rooted, we can search everywhere
-        cmd = ['shell', 'su', '-c', 'find /data/data -name "*.db" 2>/dev/null | head -20']
+        script = 'find /data/data -name "*.db" 2>/dev/null | head -20'
     else:
         # Without root, try accessible paths
-        cmd = ['shell', 'find /sdcard /storage/emulated/0 -name "*.db" 2>/dev/null | head -20']
-    
-    stdout, stderr = _run_adb_command(['-s', device_id] + cmd)
-    
-    if stdout:
-        db_files = stdout.splitlines()
-        log_action(f"Found {len(db_files)} accessible database files:")
-        for db in db_files[:10]:  # Log first 10
-            log_action(f"  - {db}")
-            
-            # Try to identify if it has location data
-            check_tables_cmd = f'sqlite3 {db} ".tables" 2>/dev/null'
-            if has_root:
-                tables_out, _ = _run_adb_command(['-s', device_id, 'shell', 'su', '-c', check_tables_cmd])
-            else:
-                tables_out, _ = _run_adb_command(['-s', device_id, 'shell', check_tables_cmd])
-            
-            if tables_out and any(keyword in tables_out.lower() for keyword in ['location', 'position', 'coordinate', 'latitude']):
-                log_action(f"    ↳ Potential location database! Tables: {tables_out[:100]}")
-    else:
+        script = 'find /sdcard /storage/emulated/0 -name "*.db" 2>/dev/null | head -20'
+    
+    stdout, _ = shell.run(script, as_root=has_root)
+    
+    if not stdout:
         log_action("No accessible databases found or permission denied")
+        return
+    
+    db_files = stdout.splitlines()
+    log_action(f"Found {len(db_files)} accessible database files:")
+    checked = db_files[:10]  # Inspect first 10
+    for db in checked:
+        log_action(f"  - {db}")
+    
+    # Try to identify which ones have location data
+    for db, tables_out in _list_tables(shell, checked, has_root).items():
+        if tables_out and any(keyword in tables_out.lower() for keyword in LOCATION_TABLE_KEYWORDS):
+            log_action(f"    ↳ Potential location database {db}! Tables: {tables_out[:100]}")
+
+def _accessible_paths(shell, paths, has_root):
+    """Returns the paths that exist and are readable, using a single ls call."""
+    script = 'ls -la ' + ' '.join(shlex.quote(path) for path in paths)
+    stdout, _ = shell.run(script, as_root=has_root)
     
-    # Always check standard paths
+    # Missing or unreadable paths show up as "ls: <path>: ..." error lines
+    listed = [line for line in stdout.splitlines() if not line.startswith('ls:')]
+    return [path for path in paths if any(line.rstrip().endswith(path) for line in listed)]
+
+def _probe_common_paths(shell, has_root):
+    """Checks all standard location database paths with a single ls call."""
     log_action("Checking standard Google location paths...")
+    accessible = _accessible_paths(shell, COMMON_DB_PATHS, has_root)
     for path in COMMON_DB_PATHS:
-        if has_root:
-            stdout, stderr = _run_adb_command(['-s', device_id, 'shell', 'su', '-c', f'ls -la {path}'])
-        else:
-            stdout, stderr = _run_adb_command(['-s', device_id, 'shell', f'ls -la {path}'])
-        
-        if 'No such file' not in stderr and 'Permission denied' not in stderr:
+        if path in accessible:
             log_action(f"  ✓ Found: {path}")
         else:
-                        log_action(f"  ✗ Not accessible: {path}")
+            log_action(f"  ✗ Not accessible: {path}")
+
+def discover_all_databases(device_id):
+    """Comprehensive database discovery on the device."""
+    log_action(f"Starting comprehensive database discovery on device {device_id}")
+    
+    with AdbShell(device_id) as shell:
+        # First check if we have root access
+        log_action("Checking device root access...")
+        stdout, _ = shell.run('id', as_root=True)
+        has_root = 'uid=0' in stdout
+        log_action(f"Root access: {'Available' if has_root else 'Not available'}")
+        
+        _probe_databases(shell, has_root)
+        _probe_common_paths(shell, has_root)
+
+def _probe_pull_targets(device_id):
+    """Checks root access and which standard databases adb can see, in one shell session."""
+    with AdbShell(device_id) as shell:
+        stdout, status = shell.run('id')
+        if status < 0:
+            # Without a working shell the probe proves nothing; let adb pull try every path
+            log_action("Could not probe the device; trying all standard paths")
+            return False, list(COMMON_DB_PATHS)
+        has_root = 'uid=0(root)' in stdout
+        # adb pull runs with adbd's own privileges, so probe without su
+        existing = _accessible_paths(shell, COMMON_DB_PATHS, has_root=False)
+    return has_root, existing
 
 def pull_location_db(device_id, local_output_path):
     """Attempts to pull location database from device."""
     log_action(f"Starting database pull from device {device_id}")
     
-    # Check if device has root
-    stdout, stderr = _run_adb_command(['-s', device_id, 'shell', 'id'])
-    has_root = 'uid=0(root)' in stdout
+    # Check root access and which known paths exist before transferring anything
+    has_root, existing = _probe_pull_targets(device_id)
     log_action(f"Root access: {'Available' if has_root else 'Not available'}")
-    
-    # Try each known path
     for remote_path in COMMON_DB_PATHS:
+        if remote_path not in existing:
+            log_action(f"✗ File doesn't exist or is not accessible: {remote_path}")
+    
+    # Try each known path that is actually there
+    failed_files = []
+    pulled_file = None
+    for remote_path in existing:
         filename = os.path.basename(remote_path)
         local_db_file = os.path.join(local_output_path, filename)
         
         log_action(f"Attempting to pull: {remote_path}")
         
         # Since we have root on emulator, try direct pull first
-        stdout, stderr = _run_adb_command(['-s', device_id, 'pull', remote_path, local_db_file])
+        stdout, stderr = _run_adb_command(['-s', device_id, 'pull', remote_path, local_db_file], text=False)
         
         # Check if pull was successful (message might be in stdout OR stderr)
-        if ('pulled' in stdout) or (stderr and 'file pulled' in stderr):
+        if (b'pulled' in stdout) or (b'file pulled' in stderr):
             log_action(f"✓ Successfully pulled {remote_path}")
-            return local_db_file
-        elif 'No such file' in stderr:
-            log_action(f"✗ File doesn't exist: {remote_path}")
-            if os.path.exists(local_db_file):
-                os.remove(local_db_file)
-        else:
-            log_action(f"✗ Pull failed: {stderr.strip() if stderr else 'Unknown error'}")
-            if os.path.exists(local_db_file):
-                os.remove(local_db_file)
+            pulled_file = local_db_file
+            break
+        
+        log_action(f"✗ Pull failed: {stderr.decode('utf-8', errors='replace') if stderr else 'Unknown error'}")
+        failed_files.append(local_db_file)
+    
+    # Drop partial files left behind by failed pulls
+    for local_db_file in failed_files:
+        if os.path.exists(local_db_file):
+            os.remove(local_db_file)
+    
+    if pulled_file:
+        return pulled_file
     
     log_action("Failed to pull any standard location database")
     log_action("Device may not have location history enabled or databases are empty")
-    return None
\ No newline at end of file
+    return None
@@ -1,36 +1,8 @@
 import sqlite3
 import os
 from datetime import datetime, timedelta
-import random
 
-os.makedirs("sample_data", exist_ok=True)
-
-
-db_path = os.path.join("sample_data", "locations.db")
-
-
-if os.path.exists(db_path):
-    os.remove(db_path)
-    print(f"Existing {db_path} removed.")
-
-# Connect to SQLite
-conn = sqlite3.connect(db_path)
-c = conn.cursor()
-
-# Create locations table with schema matching Android's location database
-c.execute('''
-CREATE TABLE IF NOT EXISTS locations (
-    _id INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp INTEGER NOT NULL,
-    latitude REAL NOT NULL,
-    longitude REAL NOT NULL,
-    accuracy INTEGER,
-    altitude REAL,
-    speed REAL,
-    bearing REAL,
-    provider TEXT
-)
-''')
+DEFAULT_DB_PATH = os.path.join("sample_data", "locations.db")
 
 # Helper function to generate timestamps
 def get_timestamp(days_ago, hour, minute):
@@ -41,7 +13,7 @@ def get_timestamp(days_ago, hour, minute):
 
 # Sample location data representing various places in San Francisco Bay Area
 # Format: (days_ago, hour, minute, latitude, longitude, accuracy, altitude, speed, bearing, provider)
-location_data = [
+DEFAULT_ROWS = (
     # Home location (morning, repeated pattern)
     (7, 8, 0, 37.7749, -122.4194, 10, 52.3, 0.0, 0.0, "gps"),
     (7, 8, 30, 37.7749, -122.4194, 12, 52.3, 0.0, 0.0, "network"),
@@ -87,42 +59,88 @@ location_data = [
     (0, 8, 0, 37.7749, -122.4194, 10, 52.3, 0.0, 0.0, "gps"),
     (0, 10, 30, 37.7805, -122.4090, 20, 30.0, 5.5, 45.0, "gps"),
     (0, 14, 0, 37.7820, -122.4015, 25, 25.0, 0.0, 0.0, "network"),
-]
+)
 
-# Insert data into database
-print("Inserting location data...")
-for data in location_data:
-    days_ago, hour, minute, lat, lon, acc, alt, speed, bearing, provider = data
-    timestamp = get_timestamp(days_ago, hour, minute)
+def build(db_path=DEFAULT_DB_PATH, rows=DEFAULT_ROWS):
+    """Create a fresh sample database at db_path.
     
+    rows is any iterable of (days_ago, hour, minute, latitude, longitude, accuracy,
+    altitude, speed, bearing, provider) tuples. It is consumed lazily, so a generator
+    can feed large synthetic datasets without building them in memory first.
+    """
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    
+    if os.path.exists(db_path):
+        os.remove(db_path)
+        print(f"Existing {db_path} removed.")
+
+    # Connect to SQLite; WAL with synchronous=NORMAL avoids an fsync per write while building
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    c = conn.cursor()
+
+    # Create locations table with schema matching Android's location database
     c.execute('''
+    CREATE TABLE IF NOT EXISTS locations (
+        _id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        accuracy INTEGER,
+        altitude REAL,
+        speed REAL,
+        bearing REAL,
+        provider TEXT
+    )
+    ''')
+    
+    # Insert data into database in a single transaction
+    print("Inserting location data...")
+    records = (
+        (get_timestamp(days_ago, hour, minute), lat, lon, acc, alt, speed, bearing, provider)
+        for days_ago, hour, minute, lat, lon, acc, alt, speed, bearing, provider in rows
+    )
+
+    conn.execute('BEGIN')
+    c.executemany('''
     INSERT INTO locations (timestamp, latitude, longitude, accuracy, altitude, speed, bearing, provider)
     VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (timestamp, lat, lon, acc, alt, speed, bearing, provider))
+    ''', records)
+
+    # Create an index on timestamp for faster queries
+    c.execute('CREATE INDEX idx_timestamp ON locations (timestamp)')
+
+    # Add some statistics
+    c.execute('SELECT COUNT(*) FROM locations')
+    total_records = c.fetchone()[0]
+
+    c.execute('SELECT MIN(timestamp), MAX(timestamp) FROM locations')
+    min_ts, max_ts = c.fetchone()
 
-# Create an index on timestamp for faster queries
-c.execute('CREATE INDEX idx_timestamp ON locations (timestamp)')
+    # Commit, then switch back to a rollback journal so the database stays a single file
+    conn.commit()
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
 
-# Add some statistics
-c.execute('SELECT COUNT(*) FROM locations')
-total_records = c.fetchone()[0]
+    # Print summary
+    print(f"\n✅ SUCCESS! locations.db created at: {os.path.abspath(db_path)}")
+    print(f"📊 Database Statistics:")
+    print(f"   - Total records: {total_records}")
+    if total_records:
+        print(f"   - Date range: {datetime.fromtimestamp(min_ts/1000).strftime('%Y-%m-%d')} to {datetime.fromtimestamp(max_ts/1000).strftime('%Y-%m-%d')}")
+    print(f"   - File size: {os.path.getsize(db_path):,} bytes")
 
-c.execute('SELECT MIN(timestamp), MAX(timestamp) FROM locations')
-min_ts, max_ts = c.fetchone()
+def describe_default_rows():
+    """Print what the built-in DEFAULT_ROWS demo data represents."""
+    print(f"\n📍 Location points include:")
+    print(f"   - Home location (repeated morning pattern)")
+    print(f"   - Commute routes with movement data")
+    print(f"   - Office locations throughout the day")
+    print(f"   - Weekend trips and activities")
+    print(f"   - Various accuracy levels and providers (gps/network/passive)")
 
-# Commit and close
-conn.commit()
-conn.close()
 
-# Print summary
-print(f"\n✅ SUCCESS! locations.db created at: {os.path.abspath(db_path)}")
-print(f"📊 Database Statistics:")
-print(f"   - Total records: {total_records}")
-print(f"   - Date range: {datetime.fromtimestamp(min_ts/1000).strftime('%Y-%m-%d')} to {datetime.fromtimestamp(max_ts/1000).strftime('%Y-%m-%d')}")
-print(f"   - File size: {os.path.getsize(db_path):,} bytes")
-print(f"\n📍 Location points include:")
-print(f"   - Home location (repeated morning pattern)")
-print(f"   - Commute routes with movement data")
-print(f"   - Office locations throughout the day")
-print(f"   - Weekend trips and activities")
-print(f"   - Various accuracy levels and providers (gps/network/passive)")
\ No newline at end of file
+if __name__ == '__main__':
+    build()
+    describe_default_rows()
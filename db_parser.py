@@ -1,6 +1,12 @@
 import sqlite3
 import datetime
 import sys
+from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass
+
+import numpy as np
+
 from output_generator import log_action
 
 # Configuration
@@ -8,28 +14,48 @@ DB_TABLE_NAME = "locations"
 TIMESTAMP_COLUMN = "timestamp"
 LATITUDE_COLUMN = "latitude"
 LONGITUDE_COLUMN = "longitude"
+MMAP_SIZE_BYTES = 256 * 1024 * 1024  # Let SQLite read the database file through mmap
+
+@dataclass
+class LocationArrays:
+    """Location points stored as parallel arrays, one entry per point."""
+    ts_ms: np.ndarray  # int64 Unix timestamps in milliseconds
+    lat: np.ndarray    # float64 latitudes
+    lon: np.ndarray    # float64 longitudes
+    
+    def __len__(self):
+        return len(self.ts_ms)
+    
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64))
+
+def _connect_readonly(db_path):
+    """Opens a database connection tuned for read-only extraction."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA query_only = 1;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES};")
+    return conn
 
 def analyze_database_schema(db_path):
     """Analyze database to find location-related tables and columns."""
     log_action(f"Analyzing database schema: {db_path}")
     
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        log_action(f"Found {len(tables)} tables in database")
+        columns_by_table = defaultdict(list)
+        with closing(_connect_readonly(db_path)) as conn:
+            # Get every table's columns in one pass over the schema catalog
+            for table_name, column_name in conn.execute(
+                "SELECT m.name, p.name FROM sqlite_master AS m "
+                "JOIN pragma_table_info(m.name) AS p WHERE m.type='table';"
+            ):
+                columns_by_table[table_name].append(column_name)
+        log_action(f"Found {len(columns_by_table)} tables in database")
         
         location_tables = []
         
-        for (table_name,) in tables:
-            # Get columns for each table
-            cursor.execute(f"PRAGMA table_info({table_name});")
-            columns = cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            
+        for table_name, column_names in columns_by_table.items():
             # Check if table has location-related columns
             has_timestamp = any('time' in col.lower() for col in column_names)
             has_lat = any('lat' in col.lower() for col in column_names)
@@ -40,15 +66,14 @@ def analyze_database_schema(db_path):
                 log_action(f"  ✓ Found location table: {table_name}")
                 log_action(f"    Columns: {', '.join(column_names)}")
         
-        conn.close()
         return location_tables
         
     except Exception as e:
-        log_action(f"Error analyzing database: {e}")
+        log_action(f"Error analyzing database: {e}", error=True)
         return []
 
 def parse_location_data(db_path):
-    """Extracts location data from the database."""
+    """Extracts location data from the database as LocationArrays sorted by ascending timestamp."""
     log_action("Starting location data extraction")
     
     # First analyze the database
@@ -59,53 +84,71 @@ def parse_location_data(db_path):
         log_action("Attempting to use default table configuration")
         location_tables = [(DB_TABLE_NAME, [TIMESTAMP_COLUMN, LATITUDE_COLUMN, LONGITUDE_COLUMN])]
     
-    location_points = []
+    chunks = []
     seven_days_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=7)
     seven_days_ago_ms = int(seven_days_ago.timestamp() * 1000)
     
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        for table_name, columns in location_tables:
-            log_action(f"Attempting to extract from table: {table_name}")
-            
-            # Find the actual column names
-            timestamp_col = next((col for col in columns if 'time' in col.lower()), TIMESTAMP_COLUMN)
-            lat_col = next((col for col in columns if 'lat' in col.lower()), LATITUDE_COLUMN)
-            lon_col = next((col for col in columns if 'lon' in col.lower()), LONGITUDE_COLUMN)
-            
-            try:
-                query = f"SELECT {timestamp_col}, {lat_col}, {lon_col} FROM {table_name} WHERE {timestamp_col} >= ? ORDER BY {timestamp_col} ASC;"
-                log_action(f"Executing query: {query}")
-                
-                cursor.execute(query, (seven_days_ago_ms,))
-                rows = cursor.fetchall()
+        with closing(_connect_readonly(db_path)) as conn:
+            # One read transaction keeps every COUNT and SELECT on the same snapshot,
+            # even if another process is still writing to the database
+            conn.execute("BEGIN")
+            for table_name, columns in location_tables:
+                log_action(f"Attempting to extract from table: {table_name}")
                 
-                log_action(f"Found {len(rows)} rows in {table_name}")
+                # Find the actual column names
+                timestamp_col = next((col for col in columns if 'time' in col.lower()), TIMESTAMP_COLUMN)
+                lat_col = next((col for col in columns if 'lat' in col.lower()), LATITUDE_COLUMN)
+                lon_col = next((col for col in columns if 'lon' in col.lower()), LONGITUDE_COLUMN)
                 
-                for row in rows:
-                    timestamp_val, lat, lon = row
+                try:
+                    # Null coordinates are dropped by SQLite during the index range scan
+                    where = f"{timestamp_col} >= ? AND {lat_col} IS NOT NULL AND {lon_col} IS NOT NULL"
+                    
+                    # Size the arrays up front so rows can be written straight into them
+                    count_query = f"SELECT COUNT(*) FROM {table_name} WHERE {where};"
+                    (row_count,) = conn.execute(count_query, (seven_days_ago_ms,)).fetchone()
+                    ts_ms = np.empty(row_count, dtype=np.int64)
+                    lats = np.empty(row_count, dtype=np.float64)
+                    lons = np.empty(row_count, dtype=np.float64)
+                    
+                    query = f"SELECT {timestamp_col}, {lat_col}, {lon_col} FROM {table_name} WHERE {where} ORDER BY {timestamp_col} ASC;"
+                    log_action(f"Executing query: {query}")
                     
-                    # Convert timestamp
-                    if timestamp_val:
-                        timestamp_dt = datetime.datetime.fromtimestamp(timestamp_val / 1000, tz=datetime.timezone.utc)
-                        
-                        if lat is not None and lon is not None:
-                            location_points.append({
-                                'timestamp': timestamp_dt,
-                                'latitude': float(lat),
-                                'longitude': float(lon)
-                            })
+                    # Stream rows straight from the cursor; the timestamp range is served by its index
+                    rows = conn.execute(query, (seven_days_ago_ms,))
+                    rows_read = 0
+                    for i, (timestamp_val, lat, lon) in zip(range(row_count), rows):
+                        ts_ms[i] = timestamp_val
+                        lats[i] = lat
+                        lons[i] = lon
+                        rows_read = i + 1
+                    
+                    # Never hand on unfilled slots, whatever the count said
+                    if rows_read < row_count:
+                        ts_ms, lats, lons = ts_ms[:rows_read], lats[:rows_read], lons[:rows_read]
+                    
+                    log_action(f"Found {rows_read} rows in {table_name}")
+                    chunks.append((ts_ms, lats, lons))
                 
-            except sqlite3.Error as e:
-                log_action(f"Error querying table {table_name}: {e}")
-                continue
+                except sqlite3.Error as e:
+                    log_action(f"Error querying table {table_name}: {e}", error=True)
+                    continue
+            conn.commit()
+        
+        if not chunks:
+            location_data = LocationArrays.empty()
+        else:
+            location_data = LocationArrays(*(np.concatenate(column) for column in zip(*chunks)))
+        
+        # Each table is read in timestamp order; merge them to keep that invariant
+        if len(chunks) > 1:
+            order = np.argsort(location_data.ts_ms, kind='stable')
+            location_data = LocationArrays(location_data.ts_ms[order], location_data.lat[order], location_data.lon[order])
         
-        conn.close()
-        log_action(f"Total location points extracted: {len(location_points)}")
-        return location_points
+        log_action(f"Total location points extracted: {len(location_data)}")
+        return location_data
         
     except Exception as e:
-        log_action(f"Critical error during parsing: {e}")
-        return []
\ No newline at end of file
+        log_action(f"Critical error during parsing: {e}", error=True)
+        return LocationArrays.empty()
@@ -1,11 +1,32 @@
 import datetime
-import math
-from typing import List, Dict, Tuple
+from math import sin, cos, atan2, sqrt, radians
+from operator import itemgetter
+from dataclasses import dataclass
+from typing import Iterator, List, Dict, Union
+
+import numpy as np
+
+from db_parser import LocationArrays
+import output_generator
+from output_generator import current_timestamp
 
 # --- Constants ---
 STOP_RADIUS_METERS = 50  # Group points within 50m
 MIN_STOP_DURATION_MINUTES = 1  # Minimum time to consider a location a "stop"
 MAX_TIME_GAP_MINUTES = 30  # Maximum time gap between points to consider them part of the same stop
+EARTH_RADIUS_METERS = 6371000
+NUMBA_MIN_POINTS = 500_000  # Below this the plain Python loop beats importing numba and loading the JIT cache
+_2R = 2 * EARTH_RADIUS_METERS  # Haversine scale factor, hoisted out of calculate_distance
+
+@dataclass(slots=True)
+class Stop:
+    """A place where the device stayed within STOP_RADIUS_METERS."""
+    arrival_time: datetime.datetime
+    departure_time: datetime.datetime
+    duration_minutes: int
+    latitude: float
+    longitude: float
+    point_count: int  # Number of location points in this stop
 
 # --- Helper Functions ---
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -13,114 +34,168 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Calculate the great circle distance between two points on Earth using Haversine formula.
     Returns distance in meters.
     """
-    # Earth's radius in meters
-    R = 6371000
-    
     # Convert to radians
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
+    lat1_rad = radians(lat1)
+    lat2_rad = radians(lat2)
+    delta_lat = radians(lat2 - lat1)
+    delta_lon = radians(lon2 - lon1)
     
     # Haversine formula
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    distance = R * c
-    
-    return distance
+    a = sin(delta_lat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon/2)**2
+    return _2R * atan2(sqrt(a), sqrt(1-a))
+
+def _approx_dist_m(lat0_cos: float, dlat: float, dlon: float) -> float:
+    """
+    Equirectangular approximation of the distance in meters for small offsets.
+    dlat/dlon are in radians and lat0_cos is the cosine of the reference latitude.
+    Within STOP_RADIUS_METERS it stays well under 1% of Haversine, without inverse trig.
+    """
+    return sqrt((EARTH_RADIUS_METERS * dlat)**2 + (EARTH_RADIUS_METERS * lat0_cos * dlon)**2)
 
-def calculate_center_point(points: List[Dict]) -> Tuple[float, float]:
+def _segment_stops(gap_minutes, lat_rad, lon_rad, radius_m, max_gap_minutes):
     """
-    Calculate the average center point of a list of location points.
-    Returns (latitude, longitude).
+    Find the index at which each stop starts in chronologically sorted points.
+    A point joins the current stop while it stays within radius_m of the stop's
+    running center and follows the previous point by at most max_gap_minutes.
+    Coordinates are in radians. Written against plain indexing and math so numba
+    can compile it unchanged.
     """
-    if not points:
-        return 0.0, 0.0
+    n = len(lat_rad)
+    starts = np.empty(n, dtype=np.int64)
+    starts[0] = 0
+    stop_count = 1
     
-    avg_lat = sum(p['latitude'] for p in points) / len(points)
-    avg_lon = sum(p['longitude'] for p in points) / len(points)
-    return avg_lat, avg_lon
+    # The center is a running mean: keep per-stop sums and reset them at each boundary
+    sum_lat = lat_rad[0]
+    sum_lon = lon_rad[0]
+    count = 1
+    center_lat = sum_lat
+    center_lon = sum_lon
+    center_cos = cos(center_lat)
+    for i in range(1, n):
+        lat = lat_rad[i]
+        lon = lon_rad[i]
+        distance = _approx_dist_m(center_cos, lat - center_lat, lon - center_lon)
+        
+        # Start a new stop when the point leaves the radius or follows a long gap
+        if distance > radius_m or gap_minutes[i - 1] > max_gap_minutes:
+            starts[stop_count] = i
+            stop_count += 1
+            sum_lat = lat
+            sum_lon = lon
+            count = 1
+        else:
+            sum_lat += lat
+            sum_lon += lon
+            count += 1
+        
+        center_lat = sum_lat / count
+        center_lon = sum_lon / count
+        center_cos = cos(center_lat)
+    
+    return starts[:stop_count]
 
-# --- Core Analysis Function ---
-def analyze_stops(location_points: List[Dict]) -> List[Dict]:
+_numba_enabled = None  # None until the first large input; then whether numba could be loaded
+
+def _enable_numba() -> bool:
+    """
+    Import the optional numba package and JIT-compile the segmentation helpers.
+    Only tried once, on the first input of at least NUMBA_MIN_POINTS points.
     """
-    Analyzes location points and groups them into "stops".
+    global _numba_enabled, _approx_dist_m, _segment_stops
+    if _numba_enabled is None:
+        try:
+            import numba
+        except ImportError:  # Optional: without numba the segmentation loop runs as plain Python
+            _numba_enabled = False
+        else:
+            _approx_dist_m = numba.njit(cache=True, fastmath=True)(_approx_dist_m)
+            _segment_stops = numba.njit(cache=True)(_segment_stops)
+            _numba_enabled = True
+    return _numba_enabled
+
+# --- Core Analysis Functions ---
+def iter_stops(location_points: Union[LocationArrays, List[Dict]], presorted: bool = False) -> Iterator[Stop]:
+    """
+    Groups location points into "stops" and yields them in chronological order.
     A stop is defined as staying within STOP_RADIUS_METERS for at least MIN_STOP_DURATION_MINUTES.
+    Points may be given as LocationArrays or as a list of timestamp/latitude/longitude dicts.
     
-    Returns a list of stops, each containing:
-    - arrival_time: datetime
-    - departure_time: datetime
-    - duration_minutes: int
-    - latitude: float
-    - longitude: float
-    - point_count: int (number of location points in this stop)
+    Pass presorted=True only when the points are already in ascending timestamp
+    order (as returned by db_parser.parse_location_data); the sort is then skipped.
     """
     if not location_points:
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No location points to analyze.")
-        return []
-    
-    # Sort by timestamp to ensure chronological order
-    sorted_points = sorted(location_points, key=lambda x: x['timestamp'])
-    
-    stops = []
-    current_stop_points = [sorted_points[0]]
+        return
     
-    for i in range(1, len(sorted_points)):
-        current_point = sorted_points[i]
+    if isinstance(location_points, LocationArrays):
+        ts_ms, lats, lons = location_points.ts_ms, location_points.lat, location_points.lon
         
-        # Calculate time difference from last point
-        time_diff = (current_point['timestamp'] - current_stop_points[-1]['timestamp']).total_seconds() / 60
+        # Sort by timestamp to ensure chronological order
+        if not presorted:
+            order = np.argsort(ts_ms, kind='stable')
+            ts_ms, lats, lons = ts_ms[order], lats[order], lons[order]
         
-        # Calculate distance from the center of current stop
-        center_lat, center_lon = calculate_center_point(current_stop_points)
-        distance = calculate_distance(
-            center_lat, center_lon,
-            current_point['latitude'], current_point['longitude']
-        )
+        n = len(ts_ms)
+        ts_seconds = ts_ms / 1000
         
-        # Check if this point belongs to the current stop
-        if distance <= STOP_RADIUS_METERS and time_diff <= MAX_TIME_GAP_MINUTES:
-            # Add to current stop
-            current_stop_points.append(current_point)
+        # Timestamps stay numeric; datetimes are only built for stop boundaries
+        def stop_time(i):
+            return datetime.datetime.fromtimestamp(ts_seconds[i], tz=datetime.timezone.utc)
+    else:
+        # Sort by timestamp to ensure chronological order
+        if presorted:
+            sorted_points = location_points
         else:
-            # Current stop has ended, process it
-            if len(current_stop_points) >= 1:
-                arrival_time = current_stop_points[0]['timestamp']
-                departure_time = current_stop_points[-1]['timestamp']
-                duration_minutes = (departure_time - arrival_time).total_seconds() / 60
-                
-                # Only record stops that meet minimum duration
-                if duration_minutes >= MIN_STOP_DURATION_MINUTES:
-                    center_lat, center_lon = calculate_center_point(current_stop_points)
-                    stops.append({
-                        'arrival_time': arrival_time,
-                        'departure_time': departure_time,
-                        'duration_minutes': int(duration_minutes),
-                        'latitude': round(center_lat, 6),
-                        'longitude': round(center_lon, 6),
-                        'point_count': len(current_stop_points)
-                    })
-            
-            # Start new stop with current point
-            current_stop_points = [current_point]
-    
-    # Don't forget to process the last stop
-    if len(current_stop_points) >= 1:
-        arrival_time = current_stop_points[0]['timestamp']
-        departure_time = current_stop_points[-1]['timestamp']
-        duration_minutes = (departure_time - arrival_time).total_seconds() / 60
+            sorted_points = sorted(location_points, key=itemgetter('timestamp'))
+        n = len(sorted_points)
         
-        if duration_minutes >= MIN_STOP_DURATION_MINUTES:
-            center_lat, center_lon = calculate_center_point(current_stop_points)
-            stops.append({
-                'arrival_time': arrival_time,
-                'departure_time': departure_time,
-                'duration_minutes': int(duration_minutes),
-                'latitude': round(center_lat, 6),
-                'longitude': round(center_lon, 6),
-                'point_count': len(current_stop_points)
-            })
+        # Load the points into flat arrays once so the math below runs as NumPy kernels
+        timestamps = [p['timestamp'] for p in sorted_points]
+        ts_seconds = np.fromiter((t.timestamp() for t in timestamps), dtype=np.float64, count=n)
+        lats = np.fromiter((p['latitude'] for p in sorted_points), dtype=np.float64, count=n)
+        lons = np.fromiter((p['longitude'] for p in sorted_points), dtype=np.float64, count=n)
+        stop_time = timestamps.__getitem__
+    
+    # Gaps are always measured against the previous point, so they vectorize directly
+    gap_minutes = np.diff(ts_seconds) / 60
     
-    print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Analyzed {len(sorted_points)} location points and found {len(stops)} stops.")
+    lat_rad = np.radians(lats)
+    lon_rad = np.radians(lons)
+    
+    # Distance is measured from the running stop center, which keeps this pass sequential.
+    # The JIT-compiled loop works on the arrays; the Python fallback is faster on lists.
+    # Once numba is loaded it is used for every input, since its cost is already paid.
+    if _numba_enabled or (n >= NUMBA_MIN_POINTS and _enable_numba()):
+        start_idx = _segment_stops(gap_minutes, lat_rad, lon_rad, STOP_RADIUS_METERS, MAX_TIME_GAP_MINUTES)
+    else:
+        start_idx = _segment_stops(gap_minutes.tolist(), lat_rad.tolist(), lon_rad.tolist(),
+                                   STOP_RADIUS_METERS, MAX_TIME_GAP_MINUTES)
+    
+    # Aggregate every stop at once: centers, point counts and durations
+    end_idx = np.append(start_idx[1:], n) - 1
+    point_counts = end_idx - start_idx + 1
+    center_lats = np.add.reduceat(lats, start_idx) / point_counts
+    center_lons = np.add.reduceat(lons, start_idx) / point_counts
+    durations = (ts_seconds[end_idx] - ts_seconds[start_idx]) / 60
+    
+    # Only yield stops that meet minimum duration
+    for k in np.flatnonzero(durations >= MIN_STOP_DURATION_MINUTES):
+        yield Stop(
+            arrival_time=stop_time(start_idx[k]),
+            departure_time=stop_time(end_idx[k]),
+            duration_minutes=int(durations[k]),
+            latitude=round(float(center_lats[k]), 6),
+            longitude=round(float(center_lons[k]), 6),
+            point_count=int(point_counts[k])
+        )
+
+def analyze_stops(location_points: Union[LocationArrays, List[Dict]], presorted: bool = False) -> List[Stop]:
+    """
+    Analyzes location points and returns all stops as a list.
+    See iter_stops for the stop definition and the presorted flag.
+    """
+    stops = list(iter_stops(location_points, presorted=presorted))
+    if output_generator.VERBOSE:
+        print(f"[{current_timestamp()}] Analyzed {len(location_points)} location points and found {len(stops)} stops.")
     
-    return stops
\ No newline at end of file
+    return stops
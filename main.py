@@ -1,21 +1,23 @@
-import argparse
 import os
 import sys
 import datetime
+from types import SimpleNamespace
 
 from adb_utils import get_connected_devices, pull_location_db, discover_all_databases
 from db_parser import parse_location_data
 from location_analyzer import analyze_stops
-from output_generator import generate_all_outputs, log_action
+import output_generator
+from output_generator import generate_all_outputs, log_action, open_action_log
 
 def setup_output_directory(output_dir):
     """Creates the output directory if it doesn't exist."""
     try:
         os.makedirs(output_dir, exist_ok=True)
+        open_action_log(output_dir)
         log_action(f"Output directory '{output_dir}' ensured.")
         return True
     except OSError as e:
-        log_action(f"Error: Could not create output directory '{output_dir}'. {e}")
+        log_action(f"Error: Could not create output directory '{output_dir}'. {e}", error=True)
         return False
 
 def select_device(devices):
@@ -33,10 +35,16 @@ def select_device(devices):
                 log_action(f"User selected device: {selected}")
                 return selected
         except KeyboardInterrupt:
-            log_action("User cancelled device selection")
+            log_action("User cancelled device selection", error=True)
             sys.exit(1)
 
-def main():
+# Command-line option -> attribute name, for the fast path in parse_args
+CLI_OPTIONS = {'-output_dir': 'output_dir', '--db_path': 'db_path'}
+CLI_FLAGS = {'--quiet': 'quiet'}
+
+def build_arg_parser():
+    """Build the full argparse parser, used for --help and for reporting usage errors."""
+    import argparse
     parser = argparse.ArgumentParser(
         description="Android Location Timeline Extractor - Real-Device Edition",
         formatter_class=argparse.RawTextHelpFormatter
@@ -52,8 +60,45 @@ def main():
         type=str,
         help='(Optional) Fallback path to a local database file if device extraction fails.'
     )
+    parser.add_argument(
+        '--quiet',
+        action='store_true',
+        help='Do not echo log messages to the console; they are still written to action_log.txt.'
+    )
+    return parser
 
-    args = parser.parse_args()
+def parse_args(argv=None):
+    """
+    Parse the command line without importing argparse for well-formed input.
+    Anything unexpected (--help, unknown options, missing values) is handed to argparse.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    values = {'output_dir': None, 'db_path': None, 'quiet': False}
+    i = 0
+    while i < len(argv):
+        if argv[i] in CLI_FLAGS:
+            values[CLI_FLAGS[argv[i]]] = True
+            i += 1
+            continue
+        option, sep, value = argv[i].partition('=')
+        dest = CLI_OPTIONS.get(option)
+        if dest is None:
+            return build_arg_parser().parse_args(argv)
+        if not sep:
+            i += 1
+            if i == len(argv) or argv[i].startswith('-'):
+                return build_arg_parser().parse_args(argv)
+            value = argv[i]
+        values[dest] = value
+        i += 1
+    
+    if values['output_dir'] is None:
+        return build_arg_parser().parse_args(argv)
+    return SimpleNamespace(**values)
+
+def main():
+    args = parse_args()
+    output_generator.VERBOSE = not args.quiet
     
     # Initialize logging
     log_action("="*60)
@@ -96,11 +141,11 @@ def main():
                 if os.path.exists(args.db_path):
                     pulled_db_path = args.db_path
                 else:
-                    log_action(f"Error: Fallback database not found at {args.db_path}")
+                    log_action(f"Error: Fallback database not found at {args.db_path}", error=True)
                     sys.exit(1)
             else:
-                log_action("No --db_path provided as fallback. Cannot proceed.")
-                log_action("TIP: Use --db_path to specify a local database file as fallback")
+                log_action("No --db_path provided as fallback. Cannot proceed.", error=True)
+                log_action("TIP: Use --db_path to specify a local database file as fallback", error=True)
                 sys.exit(1)
     else:
         log_action("No ADB devices detected")
@@ -109,16 +154,16 @@ def main():
             if os.path.exists(args.db_path):
                 pulled_db_path = args.db_path
             else:
-                log_action(f"Error: Database not found at {args.db_path}")
+                log_action(f"Error: Database not found at {args.db_path}", error=True)
                 sys.exit(1)
         else:
-            log_action("No devices found and no --db_path provided")
-            log_action("Please connect an Android device with USB debugging enabled")
-            log_action("Or provide --db_path for a local database file")
+            log_action("No devices found and no --db_path provided", error=True)
+            log_action("Please connect an Android device with USB debugging enabled", error=True)
+            log_action("Or provide --db_path for a local database file", error=True)
             sys.exit(1)
     
     if not pulled_db_path:
-        log_action("Critical error: No database available for processing")
+        log_action("Critical error: No database available for processing", error=True)
         sys.exit(1)
     
     log_action(f"Database ready for processing: {pulled_db_path}")
@@ -136,7 +181,7 @@ def main():
     
     # Analyze stops
     log_action("Starting location analysis phase...")
-    stops = analyze_stops(location_data)
+    stops = analyze_stops(location_data, presorted=True)
     log_action(f"Analysis complete: {len(stops)} stops identified")
     
     # Generate outputs
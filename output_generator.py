@@ -1,163 +1,314 @@
 import csv
 import hashlib
+import mmap
 import os
+import sys
+import threading
+import time
 import datetime
-import folium
-from folium.plugins import HeatMap
-from typing import List, Dict
-
-# Global action log
-action_log = []
-
-def log_action(message: str):
-    """Add a timestamped message to the action log."""
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-    log_entry = f"[{timestamp}] {message}"
-    action_log.append(log_entry)
-    print(log_entry)
-
-def calculate_file_hash(filepath: str) -> str:
-    """Calculate SHA-256 hash of a file."""
-    sha256_hash = hashlib.sha256()
+from collections import deque
+from operator import attrgetter
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from typing import List, NamedTuple, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    from location_analyzer import Stop
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMELINE_HEADER = ['arrival_time', 'departure_time', 'duration_minutes', 'latitude', 'longitude', 'point_count']
+
+SHORT_STOP_MINUTES = 30  # Stops shorter than this get a green marker
+LONG_STOP_MINUTES = 120  # Stops at least this long get a red marker; the rest are orange
+MARKER_COLORS = np.array(['green', 'orange', 'red'])  # Indexed by duration bucket
+
+POPUP_TIME_LENGTH = len('YYYY-MM-DD HH:MM')  # Popups show TIMESTAMP_FORMAT without seconds
+POPUP_TPL = (
+    "<b>Stop #{n}</b><br>"
+    "Arrival: {arrival}<br>"
+    "Departure: {departure}<br>"
+    "Duration: {duration} minutes<br>"
+    "Location points: {points}"
+)
+
+# Builds one marker per FastMarkerCluster row: [lat, lon, duration_minutes, stop_number, popup_html, color]
+MARKER_CALLBACK = """function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({
+        icon: 'info-sign', iconColor: 'white', markerColor: row[5], prefix: 'glyphicon'
+    }));
+    marker.bindPopup(row[4], {maxWidth: 300});
+    marker.bindTooltip('Stop #' + row[3] + ' (' + row[2] + ' min)');
+    return marker;
+}"""
+
+# Global action log: entries are buffered here until open_action_log() starts streaming them to disk
+action_log = deque()
+_action_log_file = None
+_action_log_lock = threading.Lock()
+VERBOSE = True  # Echo log entries to the console; the action log file gets them either way
+
+def current_timestamp(millis: bool = False) -> str:
+    """Format the current local time for log lines, optionally with milliseconds."""
+    # time.strftime on a struct_time skips building a datetime on every log line
+    now_ns = time.time_ns()
+    stamp = time.strftime(TIMESTAMP_FORMAT, time.localtime(now_ns // 1_000_000_000))
+    if millis:
+        return f"{stamp}.{now_ns // 1_000_000 % 1000:03d}"
+    return stamp
+
+def log_action(message: str, error: bool = False):
+    """Add a timestamped message to the action log; errors reach the console even when not VERBOSE."""
+    log_entry = f"[{current_timestamp(millis=True)}] {message}"
+    # Output generators log from worker threads; keep file and console lines whole and in order
+    with _action_log_lock:
+        if _action_log_file is not None:
+            _action_log_file.write(log_entry + "\n")
+        else:
+            action_log.append(log_entry)
+        if VERBOSE:
+            print(log_entry)
+        elif error:
+            print(log_entry, file=sys.stderr)
+
+def open_action_log(output_dir: Union[str, Path]) -> Path:
+    """Start streaming the action log to action_log.txt, flushing entries logged so far."""
+    global _action_log_file
+    filepath = Path(output_dir) / "action_log.txt"
+    f = open(filepath, 'w', encoding='utf-8')
+    rule = "=" * 70
+    f.write(
+        "Android Location Timeline Extractor - Detailed Action Log\n"
+        f"{rule}\n"
+        f"Generated at: {current_timestamp()}\n"
+        f"{rule}\n\n"
+    )
+    with _action_log_lock:
+        f.write("".join(f"{entry}\n" for entry in action_log))
+        action_log.clear()
+        _action_log_file = f
+    return filepath
+
+# Output integrity hashes are always BLAKE2b-256, so they can be checked anywhere with `b2sum -l 256`
+HASH_ALGORITHM = 'blake2b'
+HASH_DIGEST_SIZE = 32  # Bytes; 256-bit digests
+HASH_MMAP_WINDOW = 256 << 20  # Bytes of a file mapped at once while hashing (a multiple of mmap.ALLOCATIONGRANULARITY)
+MAX_HASH_WORKERS = 8  # Upper bound on files hashed concurrently
+CSV_BUFFER_SIZE = 1 << 20  # Write buffer for the CSV outputs, so large files go out in few syscalls
+
+def calculate_file_hash(filepath: Union[str, Path], size: int = None) -> str:
+    """Calculate the HASH_ALGORITHM hash of a file; pass size if it is already known."""
     try:
-        with open(filepath, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        with open(filepath, "rb", buffering=0) as f:
+            if size is None:
+                size = os.fstat(f.fileno()).st_size
+            file_hash = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+            # Map one window at a time: the hasher reads straight from the page cache
+            # with no intermediate buffers, and at most one window is mapped at once
+            for offset in range(0, size, HASH_MMAP_WINDOW):
+                length = min(HASH_MMAP_WINDOW, size - offset)
+                with mmap.mmap(f.fileno(), length, offset=offset, access=mmap.ACCESS_READ) as window:
+                    file_hash.update(window)
+            return file_hash.hexdigest()
     except Exception as e:
-        log_action(f"Error calculating hash for {filepath}: {e}")
+        log_action(f"Error calculating hash for {filepath}: {e}", error=True)
         return "ERROR"
 
-def generate_timeline_csv(stops: List[Dict], output_dir: str) -> str:
+class PreparedStop(NamedTuple):
+    """A stop formatted once for both the timeline CSV and the map."""
+    arrival_time: str
+    departure_time: str
+    duration_minutes: int
+    latitude: float
+    longitude: float
+    point_count: int
+    marker_color: str
+    popup_html: str
+
+# Reads the timeline.csv columns of a PreparedStop by name, in TIMELINE_HEADER order
+_timeline_row = attrgetter(*TIMELINE_HEADER)
+
+def _prepare_stops(stops: List['Stop']) -> List[PreparedStop]:
+    """Format every stop once for both the timeline CSV and the map."""
+    durations = np.fromiter((stop.duration_minutes for stop in stops), dtype=np.float64, count=len(stops))
+    colors = MARKER_COLORS[np.digitize(durations, [SHORT_STOP_MINUTES, LONG_STOP_MINUTES])].tolist()
+    
+    strftime = datetime.datetime.strftime
+    prepared = []
+    for i, stop in enumerate(stops):
+        arrival = strftime(stop.arrival_time, TIMESTAMP_FORMAT)
+        departure = strftime(stop.departure_time, TIMESTAMP_FORMAT)
+        popup_text = POPUP_TPL.format(
+            n=i + 1,
+            arrival=arrival[:POPUP_TIME_LENGTH],
+            departure=departure[:POPUP_TIME_LENGTH],
+            duration=stop.duration_minutes,
+            points=stop.point_count
+        )
+        prepared.append(PreparedStop(
+            arrival_time=arrival,
+            departure_time=departure,
+            duration_minutes=stop.duration_minutes,
+            latitude=stop.latitude,
+            longitude=stop.longitude,
+            point_count=stop.point_count,
+            marker_color=colors[i],
+            popup_html=popup_text
+        ))
+    return prepared
+
+def generate_timeline_csv(stops: List['Stop'], output_dir: Union[str, Path], prepared: List[PreparedStop] = None) -> Path:
     """Generate timeline.csv with stop information."""
-    filepath = os.path.join(output_dir, "timeline.csv")
+    filepath = Path(output_dir) / "timeline.csv"
     log_action("Generating timeline.csv...")
     
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['arrival_time', 'departure_time', 'duration_minutes', 'latitude', 'longitude', 'point_count']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for stop in stops:
-                writer.writerow({
-                    'arrival_time': stop['arrival_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'departure_time': stop['departure_time'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'duration_minutes': stop['duration_minutes'],
-                    'latitude': stop['latitude'],
-                    'longitude': stop['longitude'],
-                    'point_count': stop['point_count']
-                })
+        if prepared is None:
+            prepared = _prepare_stops(stops)
+        
+        with open(filepath, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(TIMELINE_HEADER)
+            writer.writerows(map(_timeline_row, prepared))
         
         log_action(f"✓ Generated timeline.csv with {len(stops)} stops")
         return filepath
     except Exception as e:
-        log_action(f"✗ Error generating timeline.csv: {e}")
+        log_action(f"✗ Error generating timeline.csv: {e}", error=True)
         raise
 
-def generate_map_html(stops: List[Dict], output_dir: str) -> str:
+def generate_map_html(stops: List['Stop'], output_dir: Union[str, Path], prepared: List[PreparedStop] = None) -> Path:
     """Generate interactive map with stops."""
-    filepath = os.path.join(output_dir, "map.html")
+    filepath = Path(output_dir) / "map.html"
     log_action("Generating map.html...")
     
     try:
+        # folium pulls in jinja2 and branca; only pay for that import when a map is built
+        import folium
+        
+        if prepared is None:
+            prepared = _prepare_stops(stops)
+        
+        # Latitude, longitude and duration as one array; it feeds both the map center and the heatmap
+        points = np.array(
+            [(row.latitude, row.longitude, row.duration_minutes) for row in prepared], dtype=np.float64
+        ).reshape(-1, 3)
+        
         if stops:
-            avg_lat = sum(stop['latitude'] for stop in stops) / len(stops)
-            avg_lon = sum(stop['longitude'] for stop in stops) / len(stops)
+            avg_lat, avg_lon = points[:, :2].mean(axis=0).tolist()
         else:
             avg_lat, avg_lon = 37.7749, -122.4194
         
-        m = folium.Map(location=[avg_lat, avg_lon], zoom_start=12)
+        # Canvas rendering keeps vector layers out of the DOM; the scale bar is never used
+        m = folium.Map(location=[avg_lat, avg_lon], zoom_start=12, prefer_canvas=True, control_scale=False)
         
-        for i, stop in enumerate(stops):
-            popup_text = f"""
-            <b>Stop #{i+1}</b><br>
-            Arrival: {stop['arrival_time'].strftime('%Y-%m-%d %H:%M')}<br>
-            Departure: {stop['departure_time'].strftime('%Y-%m-%d %H:%M')}<br>
-            Duration: {stop['duration_minutes']} minutes<br>
-            Location points: {stop['point_count']}
-            """
+        if stops:
+            # The plugins are only needed when there is something to draw on the base map
+            from folium.plugins import FastMarkerCluster, HeatMap
             
-            if stop['duration_minutes'] < 30:
-                color = 'green'
-            elif stop['duration_minutes'] < 120:
-                color = 'orange'
-            else:
-                color = 'red'
+            # Markers are emitted as one data array and built and clustered in the browser
+            marker_data = [
+                [row.latitude, row.longitude, row.duration_minutes, i + 1, row.popup_html, row.marker_color]
+                for i, row in enumerate(prepared)
+            ]
+            FastMarkerCluster(marker_data, callback=MARKER_CALLBACK).add_to(m)
             
-            folium.Marker(
-                location=[stop['latitude'], stop['longitude']],
-                popup=folium.Popup(popup_text, max_width=300),
-                tooltip=f"Stop #{i+1} ({stop['duration_minutes']} min)",
-                icon=folium.Icon(color=color)
-            ).add_to(m)
-        
-        # Add heatmap
-        if stops:
-            heat_data = [[stop['latitude'], stop['longitude'], stop['duration_minutes']] for stop in stops]
+            # Add heatmap
+            heat_data = points.tolist()
             HeatMap(heat_data, radius=15, blur=10).add_to(m)
         
+        # folium/branca compile each element's Jinja template once, at class definition,
+        # so repeated saves in one process only pay for rendering, not template compilation
         m.save(filepath)
         log_action(f"✓ Generated map.html with {len(stops)} markers and heatmap")
         return filepath
     except Exception as e:
-        log_action(f"✗ Error generating map.html: {e}")
+        log_action(f"✗ Error generating map.html: {e}", error=True)
         raise
 
-def generate_hashes_csv(files_to_hash: List[str], output_dir: str) -> str:
+def generate_hashes_csv(files_to_hash: List[Union[str, Path]], output_dir: Union[str, Path]) -> Path:
     """Generate hashes.csv."""
-    filepath = os.path.join(output_dir, "hashes.csv")
+    filepath = Path(output_dir) / "hashes.csv"
     log_action("Generating hashes.csv...")
     
     try:
-        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+        # One stat per file both skips missing files and tells the hasher how much to map
+        existing = []
+        sizes = []
+        for path in files_to_hash:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            existing.append(path)
+            sizes.append(st.st_size)
+        
+        # hashlib releases the GIL while digesting, so threads hash files in parallel
+        file_hashes = []
+        if existing:
+            with ThreadPoolExecutor(max_workers=min(MAX_HASH_WORKERS, len(existing))) as executor:
+                file_hashes = list(executor.map(calculate_file_hash, existing, sizes))
+        
+        with open(filepath, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE) as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(['filename', 'sha256_hash'])
+            writer.writerow(['filename', f'{HASH_ALGORITHM}_hash'])
             
-            for file_path in files_to_hash:
-                if os.path.exists(file_path):
-                    filename = os.path.basename(file_path)
-                    file_hash = calculate_file_hash(file_path)
-                    writer.writerow([filename, file_hash])
-                    log_action(f"  - {filename}: {file_hash[:16]}...")
+            for file_path, file_hash in zip(existing, file_hashes):
+                filename = Path(file_path).name
+                writer.writerow([filename, file_hash])
+                log_action(f"  - {filename}: {file_hash[:16]}...")
         
         log_action("✓ Generated hashes.csv")
         return filepath
     except Exception as e:
-        log_action(f"✗ Error generating hashes.csv: {e}")
+        log_action(f"✗ Error generating hashes.csv: {e}", error=True)
         raise
 
-def generate_action_log(output_dir: str) -> str:
-    """Generate comprehensive action log."""
-    filepath = os.path.join(output_dir, "action_log.txt")
-    log_action("Generating action_log.txt...")
+def generate_action_log(output_dir: Union[str, Path]) -> Path:
+    """Finish the action log with a completion footer and close it."""
+    global _action_log_file
+    filepath = Path(output_dir) / "action_log.txt"
     
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write("Android Location Timeline Extractor - Detailed Action Log\n")
-            f.write("=" * 70 + "\n")
-            f.write(f"Generated at: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 70 + "\n\n")
-            
-            for entry in action_log:
-                f.write(entry + "\n")
-            
-            f.write(f"\n[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Action log completed.")
+        # Entries are already on disk when the log was opened at startup
+        if _action_log_file is None:
+            open_action_log(output_dir)
+        log_action("Generating action_log.txt...")
         
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✓ Generated action_log.txt")
+        completed_at = current_timestamp()
+        with _action_log_lock:
+            f, _action_log_file = _action_log_file, None
+        with f:
+            f.write(f"\n[{completed_at}] Action log completed.")
+        
+        if VERBOSE:
+            print(f"[{completed_at}] ✓ Generated action_log.txt")
         return filepath
     except Exception as e:
-        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ✗ Error generating action_log.txt: {e}")
+        print(f"[{current_timestamp()}] ✗ Error generating action_log.txt: {e}", file=sys.stdout if VERBOSE else sys.stderr)
         raise
 
-def generate_all_outputs(stops: List[Dict], output_dir: str):
+def generate_all_outputs(stops: List['Stop'], output_dir: Union[str, Path]):
     """Generate all required output files."""
     log_action("="*50)
     log_action("Starting output file generation")
     log_action("="*50)
     
-    timeline_path = generate_timeline_csv(stops, output_dir)
-    map_path = generate_map_html(stops, output_dir)
+    # Build the directory path once; each generator joins its file name onto it
+    output_dir = Path(output_dir)
+    
+    # Format the stops once and share the rows between the CSV and the map
+    prepared = _prepare_stops(stops)
+    
+    # The CSV and the map write separate files, so they are built side by side
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        timeline_future = executor.submit(generate_timeline_csv, stops, output_dir, prepared)
+        map_future = executor.submit(generate_map_html, stops, output_dir, prepared)
+        timeline_path = timeline_future.result()
+        map_path = map_future.result()
+    
+    # The action log closes last so it records both generators
     log_path = generate_action_log(output_dir)
     
     files_to_hash = [timeline_path, map_path, log_path]
@@ -165,5 +316,5 @@ def generate_all_outputs(stops: List[Dict], output_dir: str):
     
     log_action("="*50)
     log_action("All output files generated successfully!")
-    log_action(f"Output directory: {os.path.abspath(output_dir)}")
+    log_action(f"Output directory: {output_dir.absolute()}")
     log_action("="*50)
\ No newline at end of file